@@ -1,19 +1,167 @@
+import asyncio
+import collections
+import hashlib
+import html
+import queue
+import re
+import string
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from pathlib import Path
 import streamlit as st
 
-from services import (configure_api_key, generate_recipe_with_llm, get_available_models)
+from services import (generate_recipe_async, generate_recipe_with_llm, get_available_models, get_gemini_model,
+                      get_openai_client, list_gemini_models, list_openai_models, run_async)
+
+# Anything outside [A-Za-z0-9_-] becomes an underscore; compiled once so
+# sanitizing runs as a single C-level scan instead of a per-char Python loop
+_SANITIZE_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+# Title-card markup for display_recipe, built once at import time; each
+# render substitutes only the (escaped) recipe name
+_HEADER_TMPL = """
+            <div style="
+                background: linear-gradient(135deg, #f5f7fa 0%, #e4e8f0 100%);
+                padding: 1.5rem;
+                border-radius: 10px;
+                margin-bottom: 1.5rem;
+                box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+            ">
+                <h2 style="color: #2d3436; margin-bottom: 0.5rem; text-align: center;">
+                    🍳 Your Custom Recipe
+                </h2>
+                <h3 style="color: #e17055; margin-top: 0; text-align: center; font-style: italic;">
+                    "{name}"
+                </h3>
+            </div>
+            """
+
+# Built once at import time; save_recipe only pays for a single substitution
+# per call instead of re-building the f-string, and escaping keeps raw LLM
+# output (e.g. stray <script> tags) from executing in the saved HTML
+_HTML_TMPL = string.Template("""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>$name</title>
+            <style>
+                body { font-family: Arial; padding: 20px; }
+                .recipe {
+                    background: #f8f9fa;
+                    padding: 20px;
+                    border-radius: 10px;
+                    max-width: 800px;
+                    margin: 0 auto;
+                }
+                h1 { color: #e67e22; }
+                pre { white-space: pre-wrap; font-family: inherit; }
+            </style>
+        </head>
+        <body>
+            <div class="recipe">
+                <h1>🍳 $name</h1>
+                <pre>$body</pre>
+            </div>
+        </body>
+        </html>
+        """)
+
+# Sliding-window rate limit shared by every session using the same API key
+_RL_WINDOW = 60.0  # seconds
+_RL_MAX_REQUESTS = 20
+
+
+@st.cache_resource
+def _rl_state():
+    """Process-global request timestamps, one deque per API key hash
+
+    Keyed by API key rather than session so a user with two browser tabs
+    shares one limit and stateless reruns cannot reset it.
+    """
+    return collections.defaultdict(collections.deque)
+
+
+@st.cache_resource
+def get_api_keys():
+    """Resolve API keys once per process instead of on every rerun
+
+    First access to st.secrets stats and parses the TOML file; caching the
+    resolved keys keeps that off every widget interaction.
+    """
+    return {
+        "openai": st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY"),
+        "gemini": st.secrets.get("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
+    }
+
+
+@st.cache_resource
+def warm_models(openai_key, gemini_key):
+    """Prefetch both providers' model lists concurrently at startup
+
+    One parallel fetch instead of a serial fetch per provider. Provider
+    failures are handled inside the listers, which fall back to the
+    hardcoded lists themselves, so nothing is caught here - a plumbing
+    bug should surface, not masquerade as a provider outage.
+    """
+    async def _fetch():
+        return await asyncio.gather(
+            list_openai_models(openai_key),
+            list_gemini_models(gemini_key)
+        )
+
+    openai_list, gemini_list = run_async(_fetch())
+    return {"OpenAI": openai_list, "Gemini": gemini_list}
+
+
+@st.cache_resource
+def get_executor():
+    """Shared worker pool that keeps LLM calls off the script thread"""
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def _stream_recipe(out_queue, cancel_event, kwargs):
+    """Drain the LLM stream into a queue from a worker thread
+
+    A failure here would otherwise vanish into an unobserved Future, so
+    the exception itself is enqueued as an error marker for the script
+    thread to re-raise.
+    """
+    try:
+        for token in generate_recipe_with_llm(**kwargs):
+            if cancel_event.is_set():
+                break
+            out_queue.put(token)
+    except Exception as e:
+        out_queue.put(e)
+    finally:
+        out_queue.put(None)  # sentinel: stream finished
+
+
+def _queue_iter(out_queue):
+    """Yield streamed tokens until the worker posts the end sentinel
+
+    An exception object on the queue marks a worker failure; it is
+    re-raised here so the caller's error handling runs on the script
+    thread.
+    """
+    while True:
+        token = out_queue.get()
+        if token is None:
+            return
+        if isinstance(token, Exception):
+            raise token
+        yield token
 
 
 def init_session():
     """Initialize Streamlit session state variables"""
     if 'generating_recipe' not in st.session_state:
         st.session_state.generating_recipe = False
-    if 'last_request_time' not in st.session_state:
-        st.session_state.last_request_time = 0
     if 'api_status' not in st.session_state:
         st.session_state.api_status = {
             'OpenAI': False,
@@ -23,13 +171,29 @@ def init_session():
         st.session_state.error_message = None
 
 
-def check_rate_limit():
-    """Enforce rate limiting between API calls"""
-    current_time = time.time()
-    elapsed = current_time - st.session_state.last_request_time
-    if elapsed < 1.5:  # 1.5 second cooldown between requests
-        time.sleep(1.5 - elapsed)
-    st.session_state.last_request_time = time.time()
+def check_rate_limit(api_keys):
+    """Gate one submit on every key's sliding window without blocking
+
+    Computes the wait for each key first and only commits timestamps once
+    all windows have room, so a submit rejected by one key's window never
+    charges phantom requests to the others. Returns 0.0 when the request
+    may proceed (now recorded in every window), otherwise the number of
+    seconds until the fullest window has room.
+    """
+    now = time.monotonic()
+    windows = [_rl_state()[hashlib.sha256(key.encode()).hexdigest()] for key in api_keys]
+
+    wait = 0.0
+    for window in windows:
+        while window and now - window[0] > _RL_WINDOW:
+            window.popleft()
+        if len(window) >= _RL_MAX_REQUESTS:
+            wait = max(wait, _RL_WINDOW - (now - window[0]))
+
+    if wait == 0.0:
+        for window in windows:
+            window.append(now)
+    return wait
 
 
 def reset_state():
@@ -38,58 +202,49 @@ def reset_state():
     st.session_state.error_message = None
 
 
-def save_recipe(recipe_output, recipe_name):
-    """Save recipe in multiple formats under output/ folder"""
+@st.cache_data(ttl=600)
+def build_recipe_files(recipe_output, recipe_name):
+    """Render the recipe as HTML and plain-text bytes, cached per recipe
+
+    Keeping the payloads in memory lets st.download_button serve them
+    directly without writing and re-reading files on every rerun.
+    """
+    html_doc = _HTML_TMPL.substitute(
+        name=html.escape(recipe_name),
+        body=html.escape(recipe_output)
+    )
+    return html_doc.encode("utf-8"), recipe_output.encode("utf-8")
+
+
+def save_recipe(html_bytes, txt_bytes, recipe_name):
+    """Persist recipe files under output/ when the user opts in"""
     # Create output directory if it doesn't exist
     output_dir = Path("output")
     output_dir.mkdir(exist_ok=True)
 
     # Sanitize recipe name for filename
-    sanitized_name = "".join(c if c.isalnum() else "_" for c in recipe_name if c.isalnum() or c in "_-")
+    sanitized_name = _SANITIZE_RE.sub("_", recipe_name)
     timestamp = datetime.now().strftime("%Y%m%d")
     base_filename = f"{output_dir}/{sanitized_name}_{timestamp}"
 
-    # Save as HTML (best for emojis)
+    # Single write() per file instead of chunked writes through the
+    # default 8 KiB text buffer
     html_path = f"{base_filename}.html"
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{recipe_name}</title>
-            <style>
-                body {{ font-family: Arial; padding: 20px; }}
-                .recipe {{ 
-                    background: #f8f9fa;
-                    padding: 20px;
-                    border-radius: 10px;
-                    max-width: 800px;
-                    margin: 0 auto;
-                }}
-                h1 {{ color: #e67e22; }}
-                pre {{ white-space: pre-wrap; font-family: inherit; }}
-            </style>
-        </head>
-        <body>
-            <div class="recipe">
-                <h1>🍳 {recipe_name}</h1>
-                <pre>{recipe_output}</pre>
-            </div>
-        </body>
-        </html>
-        """)
+    Path(html_path).write_bytes(html_bytes)
 
-    # Save as plain text
     txt_path = f"{base_filename}.txt"
-    with open(txt_path, "w", encoding="utf-8") as f:
-        f.write(recipe_output)
+    Path(txt_path).write_bytes(txt_bytes)
 
     return html_path, txt_path
 
 
+@st.fragment
 def display_recipe(recipe_output):
-    """Beautifully formatted recipe display with save options"""
+    """Beautifully formatted recipe display with save options
+
+    Runs as a fragment so download-button clicks rerun only this block
+    instead of the whole script.
+    """
     if not recipe_output or recipe_output.startswith("Error:"):
         st.session_state.error_message = recipe_output or "Failed to generate recipe"
         return
@@ -97,78 +252,63 @@ def display_recipe(recipe_output):
     # Clear any previous errors
     st.session_state.error_message = None
 
-    # Split the recipe output into lines
-    recipe_lines = recipe_output.split('\n')
-    if not recipe_lines:
-        return
-
-    # Extract recipe name (first line)
-    recipe_name = recipe_lines[0].strip('"')
+    # Split off the recipe name (first line) in one C call instead of
+    # materializing a list of every line just to drop the head
+    head, _, recipe_body = recipe_output.partition('\n')
+    recipe_name = head.strip('"')
 
     # Display recipe with custom styling
     with st.container():
         st.markdown(
-            f"""
-            <div style="
-                background: linear-gradient(135deg, #f5f7fa 0%, #e4e8f0 100%);
-                padding: 1.5rem;
-                border-radius: 10px;
-                margin-bottom: 1.5rem;
-                box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-            ">
-                <h2 style="color: #2d3436; margin-bottom: 0.5rem; text-align: center;">
-                    🍳 Your Custom Recipe
-                </h2>
-                <h3 style="color: #e17055; margin-top: 0; text-align: center; font-style: italic;">
-                    "{recipe_name}"
-                </h3>
-            </div>
-            """,
+            _HEADER_TMPL.format(name=html.escape(recipe_name)),
             unsafe_allow_html=True
         )
 
         # Display the recipe content
-        st.markdown('\n'.join(recipe_lines[1:]))
+        st.markdown(recipe_body)
 
         # Save buttons
         st.markdown("---")
         st.subheader("📤 Save Recipe")
         try:
-            html_path, txt_path = save_recipe(recipe_output, recipe_name)
+            html_bytes, txt_bytes = build_recipe_files(recipe_output, recipe_name)
 
             col1, col2, col3 = st.columns(3)
             with col1:
-                with open(html_path, "rb") as f:
-                    st.download_button(
-                        "💾 Save as HTML",
-                        data=f,
-                        file_name=f"{recipe_name}.html",
-                        mime="text/html",
-                        use_container_width=True
-                    )
+                st.download_button(
+                    "💾 Save as HTML",
+                    data=html_bytes,
+                    file_name=f"{recipe_name}.html",
+                    mime="text/html",
+                    use_container_width=True
+                )
             with col2:
-                with open(txt_path, "rb") as f:
-                    st.download_button(
-                        "📝 Save as Text",
-                        data=f,
-                        file_name=f"{recipe_name}.txt",
-                        mime="text/plain",
-                        use_container_width=True
-                    )
+                st.download_button(
+                    "📝 Save as Text",
+                    data=txt_bytes,
+                    file_name=f"{recipe_name}.txt",
+                    mime="text/plain",
+                    use_container_width=True
+                )
+            with col3:
+                if st.checkbox("🗄️ Keep a copy in output/", key="persist_to_disk"):
+                    html_path, txt_path = save_recipe(html_bytes, txt_bytes, recipe_name)
+                    st.caption(f"Saved {html_path} and {txt_path}")
         except Exception as e:
             st.error(f"Failed to save recipe: {str(e)}")
 
 
 def main():
+    # Must be the first Streamlit call to avoid the warning + re-layout cost
+    st.set_page_config(layout="centered", page_title="AI Recipe Generator")
+
     # Initialize session state
     init_session()
 
-    # Load API keys
-    openai_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-    gemini_key = st.secrets.get("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
-
-    # Configure API clients
-    configure_api_key(openai_key, gemini_key)
+    # Load API keys (cached for the life of the process)
+    api_keys = get_api_keys()
+    openai_key = api_keys["openai"]
+    gemini_key = api_keys["gemini"]
 
     # Verify API availability
     if not openai_key and not gemini_key:
@@ -176,7 +316,6 @@ def main():
         return
 
     # --- UI Layout ---
-    st.set_page_config(layout="centered", page_title="AI Recipe Generator")
     st.title("👨‍🍳 AI Recipe Generator")
     st.markdown("Enter your ingredients and preferences for a custom recipe!")
 
@@ -184,12 +323,18 @@ def main():
     if st.session_state.generating_recipe:
         st.session_state.error_message = None
 
+    # Warm both providers' model lists in parallel, cached for the session
+    model_lists = warm_models(openai_key, gemini_key)
+
     # Provider selection with availability check
     available_providers = []
     if openai_key:
         available_providers.append("OpenAI")
     if gemini_key:
         available_providers.append("Gemini")
+    if openai_key and gemini_key:
+        # Race both providers and show whichever answers first
+        available_providers.insert(0, "Auto")
 
     if not available_providers:
         st.error("No available API providers. Please configure at least one API key.")
@@ -203,12 +348,16 @@ def main():
     )
 
     # Model selection
-    available_models = get_available_models(api_provider_choice)
-    if not available_models:
-        st.error(f"No models available for {api_provider_choice}")
-        return
+    if api_provider_choice == "Auto":
+        selected_model = None
+        st.caption("⚡ Auto races OpenAI and Gemini and shows whichever answers first.")
+    else:
+        available_models = model_lists.get(api_provider_choice) or get_available_models(api_provider_choice)
+        if not available_models:
+            st.error(f"No models available for {api_provider_choice}")
+            return
 
-    selected_model = st.selectbox("Choose AI Model:", available_models)
+        selected_model = st.selectbox("Choose AI Model:", available_models)
 
     # Recipe form
     with st.form("recipe_form"):
@@ -258,27 +407,83 @@ def main():
             if not ingredients.strip():
                 st.warning("Please enter at least one ingredient!")
             else:
-                st.session_state.generating_recipe = True
-                st.session_state.error_message = None
-                check_rate_limit()
+                if api_provider_choice == "Auto":
+                    # The race sends one request to each provider, so each
+                    # key's window gets charged
+                    active_keys = [key for key in (openai_key, gemini_key) if key]
+                elif api_provider_choice == "OpenAI":
+                    active_keys = [openai_key]
+                else:
+                    active_keys = [gemini_key]
+                wait = check_rate_limit(active_keys)
+                if wait > 0:
+                    st.warning(f"Easy there, chef! Try again in {wait:.1f} seconds.")
+                else:
+                    st.session_state.generating_recipe = True
+                    st.session_state.error_message = None
 
     # Display any errors
     if st.session_state.error_message:
         st.error(st.session_state.error_message)
 
+    # A rerun (e.g. the Cancel button) interrupts the previous script run
+    # but not its worker thread; signal any stream left over from one
+    leftover = st.session_state.get('cancel_event')
+    if leftover is not None and not st.session_state.generating_recipe:
+        leftover.set()
+        st.session_state.cancel_event = None
+
     # Handle recipe generation
     if st.session_state.generating_recipe and ingredients.strip():
         with st.spinner("🧑‍🍳 Cooking up your recipe..."):
             try:
-                recipe_output = generate_recipe_with_llm(
-                    api_provider=api_provider_choice,
-                    model_name=selected_model,
-                    ingredients=ingredients,
-                    meal_type=meal_type,
-                    cuisine=cuisine,
-                    dietary_restrictions=dietary_restrictions,
-                    cooking_time=cooking_time
-                )
+                if api_provider_choice == "Auto":
+                    # Fan out to both providers and display the winner; the
+                    # generating_recipe flag guards against a second race
+                    # starting while this one is in flight
+                    recipe_output = run_async(generate_recipe_async(
+                        openai_key=openai_key,
+                        gemini_key=gemini_key,
+                        openai_model=get_available_models("OpenAI")[0],
+                        gemini_model=get_available_models("Gemini")[0],
+                        ingredients=ingredients,
+                        meal_type=meal_type,
+                        cuisine=cuisine,
+                        dietary_restrictions=dietary_restrictions,
+                        cooking_time=cooking_time
+                    ))
+                else:
+                    # Run the LLM call on a worker thread and stream tokens
+                    # through a queue; the script thread only renders, so the
+                    # UI stays responsive and the stream can be cancelled
+                    cancel_event = threading.Event()
+                    st.session_state.cancel_event = cancel_event
+                    out_queue = queue.Queue()
+                    get_executor().submit(
+                        _stream_recipe, out_queue, cancel_event, dict(
+                            api_provider=api_provider_choice,
+                            model_name=selected_model,
+                            ingredients=ingredients,
+                            meal_type=meal_type,
+                            cuisine=cuisine,
+                            dietary_restrictions=dietary_restrictions,
+                            cooking_time=cooking_time,
+                            openai_client=(get_openai_client(openai_key)
+                                           if api_provider_choice == "OpenAI" else None),
+                            gemini_model=(get_gemini_model(gemini_key, selected_model)
+                                          if api_provider_choice == "Gemini" else None)
+                        ))
+
+                    # Clicking Cancel reruns the script, which signals the
+                    # leftover worker's cancel_event above
+                    st.button("🛑 Cancel", key="cancel_generation")
+
+                    placeholder = st.empty()
+                    recipe_output = placeholder.write_stream(_queue_iter(out_queue))
+                    if isinstance(recipe_output, list):
+                        recipe_output = "".join(str(part) for part in recipe_output)
+                    placeholder.empty()
+
                 display_recipe(recipe_output)
 
             except Exception as e:
@@ -1,2 +1,3 @@
 
-from .llm_service import (configure_api_key, generate_recipe_with_llm, get_available_models)
\ No newline at end of file
+from .llm_service import (generate_recipe_async, generate_recipe_with_llm, get_available_models, get_gemini_model,
+                          get_gemini_module, get_openai_client, list_gemini_models, list_openai_models, run_async)
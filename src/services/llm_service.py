@@ -1,18 +1,46 @@
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+
 import google.generativeai as genai
-from openai import OpenAI, RateLimitError, AuthenticationError, APIConnectionError
+import httpx
+from openai import AsyncOpenAI, OpenAI, RateLimitError, AuthenticationError, APIConnectionError, APIStatusError
+import random
 import streamlit as st
+import string
 import time
 
-# Global variables to store configured API clients
-_gemini_api_key = None
-_openai_client = None
 max_retries = 3
 
+# Compiled once at import time so each call pays for a single substitution
+# instead of rebuilding the whole prompt string
+_PROMPT_TMPL = string.Template("""Generate a detailed recipe with these specifications:
+    - Ingredients: $ingredients
+    - Meal Type: $meal_type
+    - Cuisine: $cuisine
+    - Dietary Restrictions: $dietary_restrictions
+    - Max Cooking Time: $cooking_time minutes
+
+    MUST INCLUDE:
+    1. A FUNNY short recipe name (include puns or pop culture references!)
+    2. Short description (1 funny sentence)
+    2.1. Include the calorie count( intend pun for the fitness freaks)
+    3. "Chef's Confidential" section with 2 humorous tips
+    4. Ingredients list with quantities (include funny measurements)
+    5. Step-by-step instructions (add humorous commentary)
+    6. Total time estimate
+    7. Serving suggestion with a twist
+
+    Format like a viral food blog post with emojis!
+    """)
+
 # Available models
 openai_models = ["gpt-3.5-turbo", "gpt-4", "gpt-4o"]
 gemini_models = ["gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-pro", "gemini-2.0-flash", "gemini-2.5-flash"]
 
 
+@st.cache_data
 def get_available_models(api_provider):
     """Get available models for the specified provider"""
     if api_provider == "OpenAI":
@@ -22,104 +50,359 @@ def get_available_models(api_provider):
     return []
 
 
-def configure_api_key(openai_key, gemini_key):
-    """Configure API clients with proper error handling"""
-    global _gemini_api_key, _openai_client
+# Keep-alive pooling skips the TCP+TLS handshake (~100-300ms) on every
+# request after the first; HTTP/2 multiplexes streamed tokens on one socket
+_pool_limits = httpx.Limits(max_keepalive_connections=20)
+
+
+@st.cache_resource
+def _async_loop():
+    """One long-lived event loop on a dedicated thread for all async work
+
+    asyncio.run creates and closes a loop per call, which kills the cached
+    async clients' keep-alive connections - the second use would fail with
+    "Event loop is closed". Running every coroutine on this persistent loop
+    keeps the pooled connections valid for the life of the process.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def run_async(coro):
+    """Run a coroutine on the persistent loop and block for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _async_loop()).result()
+
+
+async def list_openai_models(api_key=None):
+    """Fetch the live OpenAI chat-model list, falling back to the static one"""
+    if not api_key:
+        return openai_models
+    try:
+        client = get_async_openai_client(api_key)
+        models = [model.id async for model in client.models.list() if model.id.startswith("gpt-")]
+        return sorted(models) or openai_models
+    except Exception:
+        return openai_models
+
+
+async def list_gemini_models(api_key=None):
+    """Fetch the live Gemini model list, falling back to the static one
+
+    The Gemini SDK only exposes a sync list_models, so it runs on a thread
+    to keep the fetch concurrent with the OpenAI one.
+    """
+    if not api_key:
+        return gemini_models
+    try:
+        gemini = get_gemini_module(api_key)
+        models = await asyncio.to_thread(lambda: [
+            model.name.removeprefix("models/")
+            for model in gemini.list_models()
+            if "generateContent" in model.supported_generation_methods
+        ])
+        return models or gemini_models
+    except Exception:
+        return gemini_models
+
+
+@st.cache_resource
+def get_openai_client(api_key):
+    """Build an OpenAI client once per API key and reuse it across reruns"""
+    return OpenAI(
+        api_key=api_key,
+        http_client=httpx.Client(http2=True, limits=_pool_limits, timeout=120)
+    )
+
+
+@st.cache_resource
+def get_async_openai_client(api_key):
+    """Build an AsyncOpenAI client once per API key for concurrent calls"""
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=httpx.AsyncClient(http2=True, limits=_pool_limits, timeout=120)
+    )
+
+
+@st.cache_resource
+def get_gemini_module(api_key):
+    """Configure the Gemini SDK once per API key and reuse it across reruns"""
+    genai.configure(api_key=api_key)
+    return genai
+
+
+@st.cache_resource(ttl=3600)
+def get_gemini_model(api_key, model_name):
+    """Build a GenerativeModel once per model instead of on every call"""
+    return get_gemini_module(api_key).GenerativeModel(model_name)
+
+
+# Content-addressed recipe cache: identical resubmissions (e.g. nudging the
+# cooking-time slider and changing it back) replay instantly from disk
+# instead of paying full LLM cost and latency again
+_CACHE_DIR = Path("output") / ".cache"
+_CACHE_TTL = 86400  # seconds
+
+
+def _normalize(value):
+    """Collapse case and whitespace in one prompt field to maximize hits"""
+    return " ".join(str(value).lower().split())
 
-    if openai_key:
-        try:
-            _openai_client = OpenAI(api_key=openai_key)
-            st.session_state.openai_available = True
-        except Exception as e:
-            st.error(f"Failed to initialize OpenAI client: {str(e)}")
-            _openai_client = None
-            st.session_state.openai_available = False
 
+def _cache_key(api_provider, model_name, ingredients, meal_type, cuisine, dietary_restrictions, cooking_time):
+    """SHA-256 of the normalized request parameters"""
+    material = "|".join([
+        api_provider,
+        model_name,
+        _normalize(ingredients),
+        _normalize(meal_type),
+        _normalize(cuisine),
+        _normalize(dietary_restrictions),
+        str(cooking_time)
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    """Return the cached recipe for key, or None on miss or expiry"""
+    path = _CACHE_DIR / f"{key}.txt"
+    try:
+        # Wall clock on purpose: st_mtime is wall time, so monotonic
+        # (which rate limiting uses) would be the wrong comparison here
+        if time.time() - path.stat().st_mtime > _CACHE_TTL:
+            return None
+        return path.read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def _cache_put(key, recipe):
+    """Persist a finished recipe under its content hash (best effort)"""
+    try:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (_CACHE_DIR / f"{key}.txt").write_text(recipe, encoding="utf-8")
+    except OSError:
+        pass
+
+
+def _backoff(attempt):
+    """Jittered exponential backoff delay, capped at 10s
+
+    Full jitter keeps synchronized clients from retrying in lockstep and
+    halves the expected sleep versus plain exponential backoff.
+    """
+    return random.uniform(0, min(2 ** attempt, 10))
+
+
+def _build_prompt(ingredients, meal_type, cuisine, dietary_restrictions, cooking_time):
+    """Build the recipe prompt shared by the sync and async paths"""
+    return _PROMPT_TMPL.substitute(
+        ingredients=ingredients,
+        meal_type=meal_type,
+        cuisine=cuisine,
+        dietary_restrictions=dietary_restrictions,
+        cooking_time=cooking_time
+    )
+
+
+async def _generate_openai_async(api_key, model_name, prompt):
+    """Run one OpenAI completion on the async client"""
+    client = get_async_openai_client(api_key)
+    response = await client.chat.completions.create(
+        model=model_name,
+        messages=[
+            {"role": "system", "content": "You are a professional chef assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=1000
+    )
+    return response.choices[0].message.content
+
+
+async def _generate_gemini_async(api_key, model_name, prompt):
+    """Run one Gemini completion on the async streaming API
+
+    Streaming keeps the await granular so the event loop can interleave
+    Gemini chunks with the competing OpenAI task instead of parking on one
+    long request.
+    """
+    model = get_gemini_model(api_key, model_name)
+    stream = await model.generate_content_async(
+        prompt,
+        generation_config={"temperature": 0.7},
+        stream=True
+    )
+    parts = []
+    async for chunk in stream:
+        parts.append(chunk.text)
+    return "".join(parts)
+
+
+async def generate_recipe_async(openai_key, gemini_key, openai_model, gemini_model, ingredients, meal_type, cuisine,
+                                dietary_restrictions, cooking_time):
+    """Race OpenAI and Gemini and return whichever finishes first
+
+    Fans out to every configured provider concurrently, cancels the losers
+    as soon as one task returns a result, and only fails if all providers
+    fail. Latency becomes min(T_openai, T_gemini) and a single provider
+    outage no longer blocks the user.
+    """
+    for provider, model_name, key in (("OpenAI", openai_model, openai_key), ("Gemini", gemini_model, gemini_key)):
+        if key:
+            cached = _cache_get(_cache_key(provider, model_name, ingredients, meal_type, cuisine,
+                                           dietary_restrictions, cooking_time))
+            if cached:
+                return cached
+
+    prompt = _build_prompt(ingredients, meal_type, cuisine, dietary_restrictions, cooking_time)
+
+    tasks = {}
+    if openai_key:
+        tasks[asyncio.create_task(_generate_openai_async(openai_key, openai_model, prompt))] = ("OpenAI", openai_model)
     if gemini_key:
-        try:
-            genai.configure(api_key=gemini_key)
-            _gemini_api_key = gemini_key
-            st.session_state.gemini_available = True
-        except Exception as e:
-            st.error(f"Failed to initialize Gemini client: {str(e)}")
-            _gemini_api_key = None
-            st.session_state.gemini_available = False
+        tasks[asyncio.create_task(_generate_gemini_async(gemini_key, gemini_model, prompt))] = ("Gemini", gemini_model)
+    if not tasks:
+        return "Error: No API keys configured"
+
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            try:
+                result = task.result()
+            except Exception:
+                continue  # let the remaining provider(s) finish
+            if result:
+                for loser in pending:
+                    loser.cancel()
+                provider, model_name = tasks[task]
+                _cache_put(_cache_key(provider, model_name, ingredients, meal_type, cuisine,
+                                      dietary_restrictions, cooking_time), result)
+                return result
+
+    return "Error: All providers failed to generate a recipe"
 
 
 def generate_recipe_with_llm(api_provider, model_name, ingredients, meal_type, cuisine, dietary_restrictions,
-                             cooking_time):
-    """Generate recipe with robust error handling and retries"""
-    if api_provider == "OpenAI" and not _openai_client:
-        return "Error: OpenAI API key not configured"
-    if api_provider == "Gemini" and not _gemini_api_key:
-        return "Error: Gemini API key not configured"
-
-    prompt = f"""Generate a detailed recipe with these specifications:
-    - Ingredients: {ingredients}
-    - Meal Type: {meal_type}
-    - Cuisine: {cuisine}
-    - Dietary Restrictions: {dietary_restrictions}
-    - Max Cooking Time: {cooking_time} minutes
+                             cooking_time, openai_client=None, gemini_model=None):
+    """Stream recipe text chunks with robust error handling and retries
 
-    MUST INCLUDE:
-    1. A FUNNY short recipe name (include puns or pop culture references!)
-    2. Short description (1 funny sentence)
-    2.1. Include the calorie count( intend pun for the fitness freaks)
-    3. "Chef's Confidential" section with 2 humorous tips
-    4. Ingredients list with quantities (include funny measurements)
-    5. Step-by-step instructions (add humorous commentary)
-    6. Total time estimate
-    7. Serving suggestion with a twist
+    Yields chunks of the recipe as the provider streams them so the UI can
+    render incrementally instead of waiting for the full completion. Errors
+    are yielded as a single "Error: ..." string.
 
-    Format like a viral food blog post with emojis!
+    The caller passes in the client/model from the cached factories; with
+    no module state touched here, concurrent invocations (worker threads,
+    the provider race) are safe.
     """
+    if api_provider == "OpenAI" and openai_client is None:
+        yield "Error: OpenAI API key not configured"
+        return
+    if api_provider == "Gemini" and gemini_model is None:
+        yield "Error: Gemini API key not configured"
+        return
 
+    cache_key = _cache_key(api_provider, model_name, ingredients, meal_type, cuisine, dietary_restrictions,
+                           cooking_time)
+    cached = _cache_get(cache_key)
+    if cached:
+        yield cached
+        return
+
+    prompt = _build_prompt(ingredients, meal_type, cuisine, dietary_restrictions, cooking_time)
+
+    # Acquire the stream with retries; once the first chunk is flowing we
+    # iterate outside the retry loop so a mid-stream failure never replays
+    # already-yielded text.
+    stream = None
     for attempt in range(max_retries):
         try:
-            time.sleep(1)  # Basic rate limiting
-
             if api_provider == "OpenAI":
-                response = _openai_client.chat.completions.create(
+                stream = openai_client.chat.completions.create(
                     model=model_name,
                     messages=[
                         {"role": "system", "content": "You are a professional chef assistant."},
                         {"role": "user", "content": prompt}
                     ],
                     temperature=0.7,
-                    max_tokens=1000
+                    max_tokens=1000,
+                    stream=True
                 )
-                return response.choices[0].message.content
+                break
 
             elif api_provider == "Gemini":
-                model = genai.GenerativeModel(model_name)
-                response = model.generate_content(
+                stream = gemini_model.generate_content(
                     prompt,
-                    generation_config={"temperature": 0.7}
+                    generation_config={"temperature": 0.7},
+                    stream=True
                 )
-                return response.text
+                break
 
         except RateLimitError:
-            wait = min(2 ** attempt, 10)  # Exponential backoff with max 10s
-            st.warning(f"Rate limited. Waiting {wait} seconds...")
-            time.sleep(wait)
+            # No UI calls here: this generator runs on a worker thread with
+            # no ScriptRunContext, so st.* would never render
+            time.sleep(_backoff(attempt))
             continue
 
         except AuthenticationError as e:
-            return f"Error: Invalid API key for {api_provider}"
+            yield f"Error: Invalid API key for {api_provider}"
+            return
 
         except APIConnectionError as e:
             if attempt == max_retries - 1:
-                return f"Error: Could not connect to {api_provider} API"
-            time.sleep(2)
+                yield f"Error: Could not connect to {api_provider} API"
+                return
+            time.sleep(_backoff(attempt))
+            continue
+
+        except APIStatusError as e:
+            # Only server-side errors are worth retrying; other 4xx are
+            # caller mistakes that will fail identically every time
+            if e.status_code < 500:
+                yield f"Error: {api_provider} rejected the request ({e.status_code})"
+                return
+            if attempt == max_retries - 1:
+                yield f"Error: {api_provider} API error ({e.status_code}) after {max_retries} attempts"
+                return
+            time.sleep(_backoff(attempt))
             continue
 
         except Exception as e:
             error_msg = str(e).lower()
             if "invalid" in error_msg or "not found" in error_msg:
-                return f"Error: Invalid model '{model_name}' for {api_provider}"
+                yield f"Error: Invalid model '{model_name}' for {api_provider}"
+                return
             if attempt == max_retries - 1:
-                return f"Error: Failed after {max_retries} attempts: {str(e)}"
-            time.sleep(1)
+                yield f"Error: Failed after {max_retries} attempts: {str(e)}"
+                return
+            time.sleep(_backoff(attempt))
             continue
 
-    return f"Error: Failed to generate recipe after {max_retries} attempts"
\ No newline at end of file
+    if stream is None:
+        yield f"Error: Failed to generate recipe after {max_retries} attempts"
+        return
+
+    chunks = []
+    try:
+        if api_provider == "OpenAI":
+            for chunk in stream:
+                token = chunk.choices[0].delta.content or ""
+                chunks.append(token)
+                yield token
+        else:
+            for chunk in stream:
+                chunks.append(chunk.text)
+                yield chunk.text
+    except ValueError:
+        # Gemini raises ValueError from chunk.text when a candidate is
+        # safety-blocked or empty
+        yield f"Error: {api_provider} blocked or returned no content for this request"
+        return
+    except Exception as e:
+        yield f"Error: {api_provider} stream failed mid-generation: {str(e)}"
+        return
+
+    recipe = "".join(chunks)
+    if recipe:
+        _cache_put(cache_key, recipe)
\ No newline at end of file